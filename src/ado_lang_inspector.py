@@ -1,12 +1,37 @@
 #!/usr/bin/env python3
-import os, sys, csv, time, base64, argparse
+import os, sys, csv, time, base64, argparse, hashlib, shelve, threading
 from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import partial
+from operator import itemgetter
 from urllib.parse import quote
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from datetime import datetime, timedelta
+try:
+    import orjson
+except ImportError:  # optional: falls back to requests' stdlib json
+    orjson = None
 
 API_VER = "7.1-preview.1"
 
+# Seconds before cached project/repo listings are refetched
+LIST_CACHE_TTL = 600
+
+# Up to this many recent paths, look files up one by one instead of listing the whole tree
+ITEM_LOOKUP_THRESHOLD = 500
+# Beyond that, list just the folders holding recent paths when there are at most this many
+DIR_LISTING_THRESHOLD = 500
+
+# Response headers stored alongside ETag-cached bodies (paging needs the continuation token)
+ETAG_KEPT_HEADERS = ("x-ms-continuationtoken",)
+
+# Languages shown in the printed summary (the tenant CSV always has all of them)
+SUMMARY_TOP_N = 20
+
+REPO_HEADERS = ["project","repository","default_branch","language","bytes"]
+
 # Extension to language map (edit as you like)
 EXT_TO_LANG = {
     "bicep": "Bicep",
@@ -41,39 +66,152 @@ EXT_TO_LANG = {
     "swift": "Swift"
 }
 
-NON_CODE_LANGS = {"Markdown", "CSV"}
+NON_CODE_LANGS = frozenset({"Markdown", "CSV"})
 
 def ext_from_path(path:str)->str:
-    name = path.rsplit("/", 1)[-1]
-    if "." not in name: return ""
-    return name.rsplit(".", 1)[-1].lower()
+    name = path.rpartition("/")[2]
+    i = name.rfind(".")
+    if i < 0: return ""
+    return name[i+1:].lower()
 
 def lang_from_ext(ext:str)->str:
     return EXT_TO_LANG.get(ext, "Other")
 
+def commit_may_add_paths(commit, created_only=False):
+    # changeCounts ships with the commit listing (e.g. {"Add": 2, "Delete": 1}); a commit
+    # with no adds (or edits/renames) cannot contribute recent paths, so skip its /changes call
+    counts = commit.get("changeCounts")
+    if not counts:
+        return True
+    wanted = ("add",) if created_only else ("add", "edit", "rename")
+    return any(n and any(w in kind.lower() for w in wanted) for kind, n in counts.items())
+
+def cancel_pending(futures):
+    # The caller gave up on a fan-out: drop calls still queued on the shared pool
+    for fut in futures:
+        fut.cancel()
+
+def parse_json(r):
+    return orjson.loads(r.content) if orjson is not None else r.json()
+
+def cached_response(url, body, headers):
+    # Stand-in for a 304 answered from the ETag cache; callers only read body and headers
+    r = requests.Response()
+    r.status_code = 200
+    r.url = url
+    r.encoding = "utf-8"
+    r._content = body
+    r.headers.update(headers)
+    return r
+
 class ADO:
-    def __init__(self, org_url:str, pat:str, rate_delay:float=0.0):
+    def __init__(self, org_url:str, pat:str, rate_delay:float=0.0, max_workers:int=16,
+                 cache_dir:str=None):
         self.org_url = org_url.rstrip("/")
         self.session = requests.Session()
         self.session.headers.update({
             "Authorization": "Basic " + base64.b64encode(f":{pat}".encode()).decode()
         })
+        # Keep one warm keep-alive connection per thread that can be in flight (repo scan
+        # workers + this client's fan-out pool) so no request pays a fresh TLS handshake
+        pool_size = 2 * max_workers
+        # Back off only when ADO throttles or fails (honouring Retry-After); the final
+        # response is returned rather than raised so raise_for_status() still reports it
+        retry = Retry(total=8, backoff_factor=0.5, status_forcelist=(429, 500, 502, 503, 504),
+                      allowed_methods=frozenset({"GET"}), respect_retry_after_header=True,
+                      raise_on_status=False)
+        self.session.mount("https://", HTTPAdapter(max_retries=retry, pool_connections=4,
+                                                   pool_maxsize=pool_size))
         self.rate_delay = rate_delay
-
-    def _get(self, url:str):
-        r = self.session.get(url)
-        if self.rate_delay: time.sleep(self.rate_delay)
+        self._rate_lock = threading.Lock()
+        self._next_call = 0.0
+        # Shared pool for fan-out requests (e.g. per-commit changes)
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        # Optional on-disk cache: commit changes never change, listings expire after a TTL
+        self._cache = None
+        self._cache_lock = threading.Lock()
+        self._etag_dir = None
+        if cache_dir:
+            # ETag-cached page bodies live in their own files; the shelve only indexes them
+            self._etag_dir = os.path.join(cache_dir, "etag")
+            os.makedirs(self._etag_dir, exist_ok=True)
+            self._cache = shelve.open(os.path.join(cache_dir, "ado_cache"))
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+        self.session.close()
+        if self._cache is not None:
+            self._cache.close()
+
+    def _cache_get(self, key, ttl=None):
+        if self._cache is None: return None
+        with self._cache_lock:
+            entry = self._cache.get(key)
+        if entry is None: return None
+        stored_at, value = entry
+        if ttl is not None and time.time() - stored_at > ttl: return None
+        return value
+
+    def _cache_set(self, key, value):
+        if self._cache is None: return
+        with self._cache_lock:
+            self._cache[key] = (time.time(), value)
+
+    def _throttle(self):
+        # Space calls rate_delay apart across all threads; sleep outside the lock
+        if not self.rate_delay: return
+        with self._rate_lock:
+            now = time.monotonic()
+            slot = max(now, self._next_call)
+            self._next_call = slot + self.rate_delay
+        if slot > now: time.sleep(slot - now)
+
+    def _get(self, url:str, etag:bool=False):
+        self._throttle()
+        # Revalidate cached bodies with If-None-Match; a 304 costs a header-only round-trip
+        key = f"etag:{url}" if etag and self._cache is not None else None
+        cached = self._cache_get(key) if key else None
+        headers = {"If-None-Match": cached[0]} if cached else None
+        r = self.session.get(url, headers=headers)
+        if r.status_code == 304 and cached:
+            etag_value, kept, body_file = cached
+            body = self._read_etag_body(body_file)
+            if body is not None:
+                return cached_response(url, body, kept)
+            # body file went missing: fetch the page unconditionally
+            r = self.session.get(url)
         r.raise_for_status()
+        if key and r.headers.get("ETag"):
+            kept = {h: r.headers[h] for h in ETAG_KEPT_HEADERS if h in r.headers}
+            body_file = self._write_etag_body(url, r.content)
+            self._cache_set(key, (r.headers["ETag"], kept, body_file))
         return r
 
+    def _read_etag_body(self, body_file):
+        try:
+            with open(os.path.join(self._etag_dir, body_file), "rb") as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def _write_etag_body(self, url, body):
+        # Written outside _cache_lock; write-then-rename keeps readers from seeing partial files
+        body_file = hashlib.sha1(url.encode()).hexdigest()
+        path = os.path.join(self._etag_dir, body_file)
+        tmp = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(body)
+        os.replace(tmp, path)
+        return body_file
+
     def paged(self, url:str):
         continuation = None
         while True:
             u = url
             if continuation:
                 u = f"{u}{'&' if '?' in u else '?'}continuationToken={quote(continuation)}"
-            r = self._get(u)
-            data = r.json()
+            r = self._get(u, etag=True)
+            data = parse_json(r)
             for item in data.get("value", []):
                 yield item
             continuation = r.headers.get("x-ms-continuationtoken")
@@ -82,12 +220,22 @@ class ADO:
 
     # --- Projects / Repos ---
     def list_projects(self):
-        url = f"{self.org_url}/_apis/projects?api-version={API_VER}"
-        return list(self.paged(url))
+        key = f"{self.org_url}:projects"
+        projects = self._cache_get(key, ttl=LIST_CACHE_TTL)
+        if projects is None:
+            url = f"{self.org_url}/_apis/projects?api-version={API_VER}"
+            projects = list(self.paged(url))
+            self._cache_set(key, projects)
+        return projects
 
     def list_repos(self, project_id):
-        url = f"{self.org_url}/{project_id}/_apis/git/repositories?api-version={API_VER}"
-        return list(self.paged(url))
+        key = f"{self.org_url}:{project_id}:repos"
+        repos = self._cache_get(key, ttl=LIST_CACHE_TTL)
+        if repos is None:
+            url = f"{self.org_url}/{project_id}/_apis/git/repositories?api-version={API_VER}"
+            repos = list(self.paged(url))
+            self._cache_set(key, repos)
+        return repos
 
     # --- Items (tree listing) ---
     def list_files(self, project_id, repo_id, branch_name):
@@ -96,6 +244,9 @@ class ADO:
                f"&versionDescriptor.versionType=branch"
                f"&versionDescriptor.version={quote(branch_name)}"
                f"&api-version={API_VER}")
+        return self._blobs(url)
+
+    def _blobs(self, url):
         for item in self.paged(url):
             if not item.get("isFolder", False) and item.get("gitObjectType") == "blob":
                 # Since API returns size=0, use 1 for file count
@@ -104,6 +255,61 @@ class ADO:
                 if path is not None:
                     yield {"path": path, "size": size}
 
+    def _files_in_dir(self, project_id, repo_id, branch_name, dir_path):
+        base = f"{self.org_url}/{project_id}/_apis/git/repositories/{repo_id}/items"
+        url = (f"{base}?scopePath={quote(dir_path)}&recursionLevel=OneLevel"
+               f"&versionDescriptor.versionType=branch"
+               f"&versionDescriptor.version={quote(branch_name)}"
+               f"&api-version={API_VER}")
+        try:
+            return list(self._blobs(url))
+        except requests.HTTPError as e:
+            # folder no longer exists on the branch tip
+            if e.response is not None and e.response.status_code == 404:
+                return []
+            raise
+
+    def list_files_in_dirs(self, project_id, repo_id, branch_name, dirs):
+        # List only the given folders (one level each, concurrently) instead of the whole tree
+        futures = [self.executor.submit(self._files_in_dir, project_id, repo_id, branch_name, d)
+                   for d in sorted(dirs)]
+        try:
+            for fut in futures:
+                yield from fut.result()
+        except BaseException:
+            cancel_pending(futures)
+            raise
+
+    def _file_at(self, project_id, repo_id, branch_name, path):
+        base = f"{self.org_url}/{project_id}/_apis/git/repositories/{repo_id}/items"
+        url = (f"{base}?path={quote(path)}"
+               f"&versionDescriptor.versionType=branch"
+               f"&versionDescriptor.version={quote(branch_name)}"
+               f"&$format=json&api-version={API_VER}")
+        try:
+            item = parse_json(self._get(url))
+        except requests.HTTPError as e:
+            # changed in the window but no longer on the branch tip
+            if e.response is not None and e.response.status_code == 404:
+                return None
+            raise
+        if item.get("isFolder", False) or item.get("gitObjectType") != "blob":
+            return None
+        return {"path": path, "size": 1}
+
+    def list_files_at(self, project_id, repo_id, branch_name, paths):
+        # Look up only the given paths (concurrently) instead of listing the whole tree
+        futures = [self.executor.submit(self._file_at, project_id, repo_id, branch_name, path)
+                   for path in sorted(paths)]
+        try:
+            for fut in futures:
+                item = fut.result()
+                if item is not None:
+                    yield item
+        except BaseException:
+            cancel_pending(futures)
+            raise
+
     # --- Commits / Changes (for recency filters) ---
     def list_commits(self, project_id, repo_id, branch_name, from_date_iso):
         commits = []
@@ -114,7 +320,7 @@ class ADO:
                    f"&searchCriteria.fromDate={quote(from_date_iso)}"
                    f"&$top={top}&$skip={skip}&api-version={API_VER}")
             r = self._get(url)
-            batch = r.json().get("value", [])
+            batch = parse_json(r).get("value", [])
             if not batch:
                 break
             commits.extend(batch)
@@ -123,22 +329,44 @@ class ADO:
             skip += top
         return commits
 
+    def _commit_changes(self, project_id, repo_id, cid):
+        key = f"{repo_id}:{cid}:changes"
+        cached = self._cache_get(key)
+        if cached is not None:
+            return cached
+        url = (f"{self.org_url}/{project_id}/_apis/git/repositories/{repo_id}/commits/{cid}/changes"
+               f"?api-version={API_VER}")
+        r = self._get(url)
+        added, edited = set(), set()
+        for ch in parse_json(r).get("changes", []):
+            ctype = (ch.get("changeType") or "").lower()
+            item = ch.get("item") or {}
+            path = item.get("path")
+            # folders have no size on the tip and would only cost wasted item lookups
+            if not path or item.get("isFolder", False) or item.get("gitObjectType") == "tree":
+                continue
+            if ctype == "add":
+                added.add(path)
+            elif ctype in ("edit","rename"):
+                edited.add(path)
+        result = (frozenset(added), frozenset(edited))
+        self._cache_set(key, result)
+        return result
+
     def list_changed_paths_for_commits(self, project_id, repo_id, commit_ids, created_only=False):
         changed, created = set(), set()
-        for cid in commit_ids:
-            url = (f"{self.org_url}/{project_id}/_apis/git/repositories/{repo_id}/commits/{cid}/changes"
-                   f"?api-version={API_VER}")
-            r = self._get(url)
-            for ch in r.json().get("changes", []):
-                ctype = (ch.get("changeType") or "").lower()
-                item = ch.get("item") or {}
-                path = item.get("path")
-                if not path:
-                    continue
-                if ctype == "add":
-                    created.add(path); changed.add(path)
-                elif ctype in ("edit","rename"):
-                    changed.add(path)
+        futures = [self.executor.submit(self._commit_changes, project_id, repo_id, cid)
+                   for cid in commit_ids]
+        # merge per-commit results here rather than sharing sets across threads
+        try:
+            for fut in as_completed(futures):
+                added, edited = fut.result()
+                created |= added
+                changed |= added
+                changed |= edited
+        except BaseException:
+            cancel_pending(futures)
+            raise
         return (created if created_only else changed)
 
 def parse_args():
@@ -159,37 +387,134 @@ def parse_args():
                    default=os.environ.get("EXCLUDE_NON_CODE","false").lower()=="true",
                    help="Exclude non-code (Markdown/CSV) from % calculation")
     p.add_argument("--rate-delay", type=float, default=float(os.environ.get("RATE_DELAY","0.0")),
-                   help="Seconds to sleep between API calls (e.g., 0.05)")
-    return p.parse_args()
+                   help="Optional pacing: minimum seconds between API calls (e.g., 0.05); "
+                        "throttling (429/503) is retried automatically")
+    p.add_argument("--workers", type=int, default=int(os.environ.get("WORKERS","16")),
+                   help="Number of repositories to scan concurrently")
+    p.add_argument("--no-cache", action="store_true",
+                   default=os.environ.get("NO_CACHE","false").lower()=="true",
+                   help="Disable the on-disk API cache under <out>/.cache")
+    args = p.parse_args()
+    if args.workers < 1:
+        p.error("--workers must be at least 1")
+    return args
 
 def ensure_out(path):
     os.makedirs(path, exist_ok=True)
 
-def write_csv(path, rows, headers):
-    with open(path, "w", newline="", encoding="utf-8") as f:
-        w = csv.DictWriter(f, fieldnames=headers)
-        w.writeheader()
-        for r in rows:
-            w.writerow(r)
+def row_getter(headers):
+    # Pull a row dict's values in header order via itemgetter (C-level). With one key
+    # itemgetter returns a bare value, which csv.writer would split per character.
+    get = itemgetter(*headers)
+    return get if len(headers) > 1 else (lambda r: (get(r),))
 
-def main():
-    args = parse_args()
-    if not args.org_url or not args.pat:
-        print("Please set --org-url/--pat or ADO_ORG_URL/ADO_PAT.", file=sys.stderr)
-        return 2
-
-    # resolve since date
-    since_iso = None
-    if args.since_iso:
-        since_iso = args.since_iso
-    elif args.since_days and args.since_days > 0:
-        since_iso = (datetime.utcnow() - timedelta(days=args.since_days)).strftime("%Y-%m-%d")
-
-    ado = ADO(args.org_url, args.pat, rate_delay=args.rate_delay)
+def csv_row_writer(f, headers):
+    # Write the header row; returns a function that appends row dicts in header order
+    w = csv.writer(f)
+    w.writerow(headers)
+    row_values = row_getter(headers)
+    return lambda rows: w.writerows(map(row_values, rows))
 
+def write_csv(path, rows, headers):
+    # csv.writer + row_getter keeps the per-row work in C; 1 MiB buffer cuts write() calls
+    with open(path, "w", newline="", encoding="utf-8", buffering=1 << 20) as f:
+        csv_row_writer(f, headers)(rows)
+
+def scan_repo(ado, args, since_iso, proj_id, proj_name, repo):
+    # Scan one repository; returns (per-repo rows, language byte counter)
+    repo_name = repo["name"]
+    default_branch = repo.get("defaultBranch")
+    print(f"  - Processing repo: {proj_name}/{repo_name}")
+    if not default_branch:
+        print(f"    No default branch found for {repo_name}, skipping.")
+        return [{
+            "project": proj_name,
+            "repository": repo_name,
+            "default_branch": "",
+            "language": "",
+            "bytes": 0
+        }], Counter()
+
+    branch_name = default_branch.replace("refs/heads/","")
+    print(f"    {repo_name} default branch: {branch_name}")
+
+    # optional recent filter
+    recent_paths = None
+    if since_iso:
+        commits = ado.list_commits(proj_id, repo["id"], branch_name, since_iso)
+        commit_ids = [c["commitId"] for c in commits if commit_may_add_paths(c, args.created_only)]
+        print(f"    {repo_name}: found {len(commits)} commits since {since_iso}, "
+              f"{len(commit_ids)} with added/edited files")
+        if commit_ids:
+            recent_paths = ado.list_changed_paths_for_commits(
+                proj_id, repo["id"], commit_ids, created_only=args.created_only
+            )
+            print(f"    {repo_name}: found {len(recent_paths)} changed paths")
+        else:
+            recent_paths = set()
+
+    file_count = 0
+    # Accumulate into a plain dict (no Counter.__missing__ per file); totals are summed once after
+    sizes = {}
+    sizes_get = sizes.get
+
+    # ext_from_path/lang_from_ext inlined: this loop runs once per file in the tree
+    ext_lang = EXT_TO_LANG.get
+    try:
+        # With a recency filter, fetch as little of the tree as the recent paths need
+        if recent_paths is None:
+            items = ado.list_files(proj_id, repo["id"], branch_name)
+        elif not recent_paths:
+            # nothing touched in the window: every file would be rejected
+            items = ()
+        elif len(recent_paths) <= ITEM_LOOKUP_THRESHOLD:
+            items = ado.list_files_at(proj_id, repo["id"], branch_name, recent_paths)
+        else:
+            dirs = {p.rpartition("/")[0] or "/" for p in recent_paths}
+            if len(dirs) <= DIR_LISTING_THRESHOLD:
+                items = ado.list_files_in_dirs(proj_id, repo["id"], branch_name, dirs)
+            else:
+                items = ado.list_files(proj_id, repo["id"], branch_name)
+        for item in items:
+            file_count += 1
+            path = item["path"]
+            if recent_paths is not None and path not in recent_paths:
+                continue
+            name = path.rpartition("/")[2]
+            dot = name.rfind(".")
+            lang = ext_lang(name[dot+1:].lower() if dot >= 0 else "", "Other")
+            sizes[lang] = sizes_get(lang, 0) + item["size"]
+        lang_bytes = Counter(sizes)
+        total_bytes = sum(sizes.values())
+        # file_count is what was fetched: the whole tree, scoped folders or looked-up paths
+        print(f"    {repo_name}: fetched {file_count} file entries, total bytes: {total_bytes}")
+    except requests.HTTPError as e:
+        print(f"    ! Error listing files for {proj_name}/{repo_name}: {e}", file=sys.stderr)
+        return [], Counter()
+
+    if total_bytes == 0:
+        print(f"    No files or bytes found for {repo_name}")
+        return [{
+            "project": proj_name,
+            "repository": repo_name,
+            "default_branch": default_branch,
+            "language": "",
+            "bytes": 0
+        }], lang_bytes
+
+    print(f"    {repo_name} languages found: {dict(lang_bytes)}")
+    rows = [{
+        "project": proj_name,
+        "repository": repo_name,
+        "default_branch": default_branch,
+        "language": lang,
+        "bytes": b
+    } for lang, b in lang_bytes.items()]
+    return rows, lang_bytes
+
+def scan_tenant(ado, args, since_iso):
     ensure_out(args.out)
 
-    per_repo_rows = []
     tenant_totals = Counter()
     tenant_totals_code_only = Counter()
 
@@ -203,96 +528,35 @@ def main():
             return 1
         print(f"Filtering to project: {args.project}")
 
-    for p in projects:
-        proj_id = p["id"]
-        proj_name = p["name"]
-        repos = ado.list_repos(proj_id)
-        print(f"- {proj_name}: {len(repos)} repos")
-
-        for repo in repos:
-            repo_name = repo["name"]
-            default_branch = repo.get("defaultBranch")
-            print(f"  - Processing repo: {repo_name}")
-            if not default_branch:
-                print(f"    No default branch found for {repo_name}, skipping.")
-                per_repo_rows.append({
-                    "project": proj_name,
-                    "repository": repo_name,
-                    "default_branch": "",
-                    "language": "",
-                    "bytes": 0
-                })
-                continue
+    all_repos = []
+    # List every project's repos concurrently; map() keeps project order
+    repo_lists = ado.executor.map(lambda p: ado.list_repos(p["id"]), projects)
+    for p, repos in zip(projects, repo_lists):
+        print(f"- {p['name']}: {len(repos)} repos")
+        all_repos.extend((p["id"], p["name"], repo) for repo in repos)
 
-            branch_name = default_branch.replace("refs/heads/","")
-            print(f"    Default branch: {branch_name}")
-
-            # optional recent filter
-            recent_paths = None
-            if since_iso:
-                print(f"    Filtering files changed since {since_iso}")
-                commits = ado.list_commits(proj_id, repo["id"], branch_name, since_iso)
-                commit_ids = [c["commitId"] for c in commits]
-                print(f"    Found {len(commit_ids)} commits since {since_iso}")
-                if commit_ids:
-                    recent_paths = ado.list_changed_paths_for_commits(
-                        proj_id, repo["id"], commit_ids, created_only=args.created_only
-                    )
-                    print(f"    Found {len(recent_paths)} changed paths")
-                else:
-                    recent_paths = set()
-                    print("    No commits found, no recent paths")
-
-            lang_bytes = Counter()
-            total_bytes = 0
-            file_count = 0
-
-            try:
-                print(f"    Listing files in {repo_name}...")
-                for item in ado.list_files(proj_id, repo["id"], branch_name):
-                    file_count += 1
-                    if recent_paths is not None and item["path"] not in recent_paths:
-                        continue
-                    size = item["size"]
-                    total_bytes += size
-                    ext = ext_from_path(item["path"])
-                    lang = lang_from_ext(ext)
-                    lang_bytes[lang] += size
-                print(f"    Found {file_count} files, total bytes: {total_bytes}")
-            except requests.HTTPError as e:
-                print(f"    ! Error listing files for {proj_name}/{repo_name}: {e}", file=sys.stderr)
-                continue
-
-            if total_bytes == 0:
-                print(f"    No files or bytes found for {repo_name}")
-                per_repo_rows.append({
-                    "project": proj_name,
-                    "repository": repo_name,
-                    "default_branch": default_branch,
-                    "language": "",
-                    "bytes": 0
-                })
-            else:
-                print(f"    Languages found: {dict(lang_bytes)}")
-                for lang, b in lang_bytes.items():
-                    per_repo_rows.append({
-                        "project": proj_name,
-                        "repository": repo_name,
-                        "default_branch": default_branch,
-                        "language": lang,
-                        "bytes": b
-                    })
-                    tenant_totals[lang] += b
-                    if (not args.exclude_non_code) or (lang not in NON_CODE_LANGS):
-                        tenant_totals_code_only[lang] += b
-
-    # Write CSVs
+    exclude = args.exclude_non_code
+    # Stream per-repo rows as each repo completes so partial results survive a crash
     repo_csv = os.path.join(args.out, "repo_language_stats.csv")
-    write_csv(repo_csv, per_repo_rows, ["project","repository","default_branch","language","bytes"])
+    scan_repo_partial = partial(scan_repo, ado, args, since_iso)
+    with open(repo_csv, "w", newline="", encoding="utf-8") as f, \
+            ThreadPoolExecutor(max_workers=args.workers) as ex:
+        write_rows = csv_row_writer(f, REPO_HEADERS)
+        # map() yields in submission order, so aggregation and writes stay in this thread
+        for rows, lang_bytes in ex.map(scan_repo_partial, *zip(*all_repos)):
+            write_rows(rows)
+            f.flush()
+            tenant_totals.update(lang_bytes)
+            if exclude:
+                tenant_totals_code_only.update(
+                    {lang: b for lang, b in lang_bytes.items() if lang not in NON_CODE_LANGS})
+            else:
+                tenant_totals_code_only.update(lang_bytes)
 
+    # Write tenant summary
     total_all = sum(tenant_totals.values()) or 1
     rows = []
-    for lang, b in tenant_totals.most_common():
+    for lang, b in sorted(tenant_totals.items(), key=itemgetter(1), reverse=True):
         rows.append({
             "language": lang,
             "bytes": b,
@@ -303,13 +567,34 @@ def main():
 
     # Pretty print code-only summary
     total_code = sum(tenant_totals_code_only.values()) or 1
-    print("\n== Tenant summary (code-only %) ==")
-    for lang, b in tenant_totals_code_only.most_common():
+    print(f"\n== Tenant summary (code-only %, top {SUMMARY_TOP_N}) ==")
+    for lang, b in tenant_totals_code_only.most_common(SUMMARY_TOP_N):
         pct = 100.0 * b / total_code
         print(f"{lang:15s} {pct:6.2f}%")
 
     print(f"\nWrote:\n - {repo_csv}\n - {tenant_csv}")
     return 0
 
+def main():
+    args = parse_args()
+    if not args.org_url or not args.pat:
+        print("Please set --org-url/--pat or ADO_ORG_URL/ADO_PAT.", file=sys.stderr)
+        return 2
+
+    # resolve since date
+    since_iso = None
+    if args.since_iso:
+        since_iso = args.since_iso
+    elif args.since_days and args.since_days > 0:
+        since_iso = (datetime.utcnow() - timedelta(days=args.since_days)).strftime("%Y-%m-%d")
+
+    cache_dir = None if args.no_cache else os.path.join(args.out, ".cache")
+    ado = ADO(args.org_url, args.pat, rate_delay=args.rate_delay, max_workers=args.workers,
+              cache_dir=cache_dir)
+    try:
+        return scan_tenant(ado, args, since_iso)
+    finally:
+        ado.close()
+
 if __name__ == "__main__":
     sys.exit(main())